@@ -1,8 +1,16 @@
 # main_bot.py
 import os
 import asyncio
+import atexit
+import collections
+import functools
 import json
 import logging
+import logging.handlers
+import queue
+import random
+import re
+import sqlite3
 import time
 import sys
 from typing import Optional, Tuple
@@ -13,34 +21,137 @@ if sys.platform == "win32":
     sys.stdout = codecs.getwriter("utf-8")(sys.stdout.detach())
     sys.stderr = codecs.getwriter("utf-8")(sys.stderr.detach())
 
+import aiohttp
 import MetaTrader5 as mt5
-import pandas as pd
-import pandas_ta as ta
+import msgspec
+from cachetools import TTLCache
+import numpy as np
+try:
+    from numba import njit
+except ImportError:
+    # Без numba обчислювальні ядра виконуються як звичайний Python
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+import sqlite_vec
+import websockets
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+try:
+    import zmq
+    import zmq.asyncio
+except ImportError:
+    zmq = None
 from dotenv import load_dotenv
 from openai import AsyncOpenAI
 from telegram import Bot
 import threading
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 from telegram.ext import Application, CommandHandler, ContextTypes
-import requests
 
-TRADE_LOG_FILE = "trade_results.json"
-trade_log_lock = threading.Lock()
+# Усі часові мітки бота — aware-datetime в UTC (utcnow/utcfromtimestamp застарілі з Python 3.12)
+_UTC = datetime.timezone.utc
 
-def log_trade_result(trade_data):
-    """Зберігає результат угоди у JSON-файл."""
-    with trade_log_lock:
+# Журнали у форматі JSON Lines: один запис на рядок, новий запис лише дописується в кінець файлу
+TRADE_LOG_FILE = "trade_results.jsonl"
+NEWS_LOG_FILE = "news_log.jsonl"
+
+def read_jsonl(path):
+    """Послідовно повертає записи з JSONL-файлу."""
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def migrate_json_log(old_path, new_path):
+    """Одноразово переносить старий журнал (JSON-масив) у JSONL, якщо нового файлу ще немає."""
+    if not os.path.exists(old_path) or os.path.exists(new_path):
+        return
+    try:
+        with open(old_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        with open(new_path, "w", encoding="utf-8") as f:
+            for record in data:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        logging.info(f"Журнал {old_path} перенесено у {new_path} ({len(data)} записів).")
+    except Exception as e:
+        logging.error(f"Помилка перенесення журналу {old_path}: {e}")
+
+# --- Фоновий запис журналів ---
+# Корутини лише ставлять запис у чергу; journal_writer дописує їх у файли пакетами,
+# тож дисковий ввід-вивід не затримує обробку новин і відкриття угод
+JOURNAL_FLUSH_INTERVAL = 0.1  # секунд
+JOURNAL_BATCH_SIZE = 64
+journal_queue = asyncio.Queue()
+
+# Файли журналів відкриваються один раз і лишаються відкритими до завершення роботи
+journal_files = {}
+
+def _journal_enc_hook(obj):
+    """Перетворює скаляри numpy (ATR, об'єм) на звичайні числа Python для msgspec."""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise NotImplementedError(f"Тип {type(obj)} не підтримується в журналі")
+
+journal_encoder = msgspec.json.Encoder(enc_hook=_journal_enc_hook)
+
+def write_journal_batch(batches):
+    """Дописує накопичені записи: один write() і flush() на журнал."""
+    # Записує лише головний event loop (і flush при завершенні), тож блокування не потрібне
+    for path, records in batches.items():
         try:
-            if os.path.exists(TRADE_LOG_FILE):
-                with open(TRADE_LOG_FILE, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-            else:
-                data = []
-            data.append(trade_data)
-            with open(TRADE_LOG_FILE, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            f = journal_files.get(path)
+            if f is None:
+                f = journal_files[path] = open(path, "ab")
+            f.write(b"".join(journal_encoder.encode(record) + b"\n" for record in records))
+            f.flush()
         except Exception as e:
-            logging.error(f"Помилка збереження trade log: {e}")
+            logging.error(f"Помилка збереження журналу {path}: {e}")
+            f = journal_files.pop(path, None)
+            if f is not None:
+                f.close()  # Наступний пакет відкриє файл заново
+
+def close_journal_files():
+    """Закриває відкриті файли журналів (при завершенні роботи)."""
+    while journal_files:
+        journal_files.popitem()[1].close()
+
+async def journal_writer():
+    loop = asyncio.get_running_loop()
+    while True:
+        path, record = await journal_queue.get()
+        batches = {path: [record]}
+        count = 1
+        deadline = loop.time() + JOURNAL_FLUSH_INTERVAL
+        while count < JOURNAL_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                path, record = await asyncio.wait_for(journal_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batches.setdefault(path, []).append(record)
+            count += 1
+        write_journal_batch(batches)
+
+def flush_journal_queue():
+    """Синхронно дописує все, що лишилося в черзі (при завершенні роботи)."""
+    batches = {}
+    while not journal_queue.empty():
+        path, record = journal_queue.get_nowait()
+        batches.setdefault(path, []).append(record)
+    write_journal_batch(batches)
+
+def log_trade_result(trade_data):
+    """Ставить результат угоди в чергу на запис у JSONL-файл."""
+    journal_queue.put_nowait((TRADE_LOG_FILE, trade_data))
 
 # --- 1. КОНФІГУРАЦІЯ ТА ІНІЦІАЛІЗАЦІЯ ---
 
@@ -51,10 +162,20 @@ load_dotenv()
 # --- Налаштування ключів API та ID (з файлу .env) ---
 # Важливо: Ніколи не зберігайте ключі прямо в коді!
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENAI_ASSISTANT_ID = os.getenv("OPENAI_ASSISTANT_ID")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL") or "gpt-4o-mini"
+OPENAI_SIGNAL_TIMEOUT = 10  # секунд на отримання сигналу
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
-POLYGON_API_KEY = os.getenv("POLYGON_API_KEY") or "ТВІЙ_КЛЮЧ"
+POLYGON_API_KEY = os.getenv("POLYGON_API_KEY")
+
+# Обов'язкові налаштування: порожнє значення з .env вважається відсутнім
+REQUIRED_SETTINGS = (
+    ("OPENAI_API_KEY", OPENAI_API_KEY),
+    ("TELEGRAM_BOT_TOKEN", TELEGRAM_BOT_TOKEN),
+    ("TELEGRAM_CHAT_ID", TELEGRAM_CHAT_ID),
+    ("POLYGON_API_KEY", POLYGON_API_KEY),
+)
+MISSING_SETTINGS = [name for name, value in REQUIRED_SETTINGS if not (value and value.strip())]
 
 # --- Налаштування торгівлі ---
 RISK_PERCENT = 10.0  # Ризик на одну угоду у відсотках. 10.0 = 10% від балансу. НЕ РЕКОМЕНДУЄТЬСЯ > 10.0
@@ -64,6 +185,14 @@ ATR_SL_MULTIPLIER = 1.5  # Множник ATR для Stop Loss
 ATR_TP_MULTIPLIER = 3.0  # Множник ATR для Take Profit
 MAGIC_NUMBER = 230523 # Унікальний ідентифікатор для ордерів цього бота
 
+# --- Налаштування семантичного кешу сигналів ---
+# Схожі за змістом заголовки (напр. той самий CPI від різних агенцій) отримують збережений сигнал без виклику асистента
+SIGNAL_CACHE_DB = "signal_cache.db"
+SIGNAL_CACHE_MAX_DISTANCE = 0.05  # Максимальна косинусна відстань між ембедингами для влучання в кеш
+SIGNAL_CACHE_TTL = 3600  # секунд; старіші сигнали не використовуються, щоб уникнути застарілих рішень
+EMBEDDING_MODEL = "text-embedding-3-small"
+EXACT_SIGNAL_CACHE_SIZE = 10000  # Точний кеш за нормалізованим заголовком, перевіряється перед семантичним
+
 # --- Налаштування фільтрації новин ---
 # Бот буде реагувати тільки на новини, що містять ці слова (для економії ресурсів)
 IMPORTANT_KEYWORDS = [
@@ -89,6 +218,33 @@ NEWS_BLACKLIST = [
     "rumor", "speculation", "unconfirmed", "minor", "recall", "dividend", "buyback"
 ]
 
+# Скомпільовані автомати: один лінійний прохід по заголовку незалежно від кількості слів у списку
+def compile_keywords(keywords):
+    """Повертає функцію title -> bool: автомат Aho–Corasick або, без pyahocorasick, regex-альтернацію.
+
+    title має бути вже у нижньому регістрі. Ключі у верхньому регістрі ("ISM") — абревіатури: вони шукаються
+    лише як окреме слово, інакше "ism" збігався б з "optimism", "tourism", "mechanism".
+    """
+    acronyms = [k.lower() for k in keywords if k.isupper()]
+    words = [k.lower() for k in keywords if not k.isupper()]
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for keyword in words:
+            automaton.add_word(keyword, keyword)
+        automaton.make_automaton()
+        scan = lambda title: next(automaton.iter(title), None) is not None
+    else:
+        # Ключові слова — ASCII, тож шукаємо по байтах заголовка без декодування символів
+        pattern = re.compile(b"|".join(re.escape(k.encode()) for k in words))
+        scan = lambda title: pattern.search(title.encode('utf-8', 'ignore')) is not None
+    if not acronyms:
+        return scan
+    acronym_pattern = re.compile(r"\b(?:" + "|".join(map(re.escape, acronyms)) + r")\b")
+    return lambda title: scan(title) or acronym_pattern.search(title) is not None
+
+matches_whitelist = compile_keywords(NEWS_WHITELIST)
+matches_blacklist = compile_keywords(NEWS_BLACKLIST)
+
 # Типи новин для фільтрації (можна розширити)
 IMPORTANT_NEWS_TYPES = ["economic", "earnings", "central_bank", "macro"]
 
@@ -96,15 +252,12 @@ IMPORTANT_NEWS_TYPES = ["economic", "earnings", "central_bank", "macro"]
 MIN_NEWS_IMPORTANCE = 2  # 1 - low, 2 - medium, 3 - high
 
 # --- Динамічний розмір лоту ---
+RISK_BY_IMPACT = (2.0, 2.0, 5.0, 10.0)  # Індекс — impact: 0/1 - low, 2 - medium, 3 - high
+
 def dynamic_risk_percent(news_data):
     """Визначає risk_percent залежно від важливості новини."""
     impact = news_data.get('importance', 1)
-    if impact == 3:
-        return 10.0  # High impact
-    elif impact == 2:
-        return 5.0   # Medium impact
-    else:
-        return 2.0   # Low impact
+    return RISK_BY_IMPACT[max(0, min(int(impact), 3))]
 
 # --- Перевірка ринкових умов ---
 MIN_LIQUIDITY_HOUR = 6   # Не торгувати з 00:00 до 06:00 UTC
@@ -114,48 +267,56 @@ MAX_SPREAD_POINTS = 30   # Максимально допустимий спре
 TRAILING_STOP_MULTIPLIER = 1.0  # 1 x ATR, можна налаштувати
 
 # --- Захист від дублювання угод ---
+# open_positions змінюють лише корутини головного event loop, тож достатньо asyncio.Lock без системних викликів
 open_positions = set()
-open_positions_lock = threading.Lock()
+open_positions_lock = asyncio.Lock()
 
 # --- Мультистратегія (структура для майбутнього) ---
 STRATEGY_MODE = "news"  # news, trend, scalping, hybrid
 
 # --- Додаткове логування новин ---
 def log_news(news_data, filtered, reason=None):
-    with trade_log_lock:
-        try:
-            if os.path.exists("news_log.json"):
-                with open("news_log.json", "r", encoding="utf-8") as f:
-                    data = json.load(f)
-            else:
-                data = []
-            entry = {
-                "time": datetime.datetime.utcnow().isoformat(),
-                "title": news_data.get('title'),
-                "type": news_data.get('type'),
-                "impact": news_data.get('importance'),
-                "filtered": filtered,
-                "reason": reason
-            }
-            data.append(entry)
-            with open("news_log.json", "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            logging.error(f"Помилка збереження news log: {e}")
+    entry = {
+        "time": datetime.datetime.now(_UTC).isoformat(),
+        "title": news_data.get('title'),
+        "type": news_data.get('type'),
+        "impact": news_data.get('importance'),
+        "filtered": filtered,
+        "reason": reason
+    }
+    journal_queue.put_nowait((NEWS_LOG_FILE, entry))
 
 # --- Ініціалізація логування ---
+# Корутини лише ставлять записи в чергу; запис у файл і консоль виконує окремий потік QueueListener
+log_formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+log_handlers = [
+    logging.FileHandler("trading_bot.log", encoding='utf-8'),
+    logging.StreamHandler()
+]
+for handler in log_handlers:
+    handler.setFormatter(log_formatter)
+log_queue = queue.SimpleQueue()
+log_listener = logging.handlers.QueueListener(log_queue, *log_handlers)
+log_listener.start()
+atexit.register(log_listener.stop)  # Дописати записи, що лишилися в черзі, при будь-якому виході
+# Запис у черзі вже відформатований QueueHandler.prepare, тож тут лише текст повідомлення —
+# префікс з часом і рівнем додає log_formatter слухача
 logging.basicConfig(
     level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler("trading_bot.log", encoding='utf-8'),
-        logging.StreamHandler()
-    ]
+    format="%(message)s",
+    handlers=[logging.handlers.QueueHandler(log_queue)]
 )
 
+# --- Перевірка налаштувань ---
+# До створення клієнтів: інакше порожній ключ дає незрозумілу помилку ініціалізації
+if MISSING_SETTINGS:
+    logging.critical("Не встановлені змінні середовища: %s. Перевірте ваш .env файл.", ", ".join(MISSING_SETTINGS))
+    sys.exit(2)
+
 # --- Ініціалізація клієнтів API ---
 try:
     openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+    # Bot тримає власний пул keep-alive з'єднань до api.telegram.org; відкривається й закривається в main()
     telegram_bot = Bot(token=TELEGRAM_BOT_TOKEN)
     logging.info("Клієнти OpenAI та Telegram успішно ініціалізовані.")
 except Exception as e:
@@ -179,101 +340,458 @@ def initialize_mt5():
     logging.info(f"Підключено до рахунку MT5: {account_info.login}, Сервер: {account_info.server}, Баланс: {account_info.balance} {account_info.currency}")
     return True
 
+# Усі виклики MT5 з корутин виконуються в одному окремому потоці:
+# вони блокуючі, а Python-біндинг MT5 не розрахований на паралельні виклики
+mt5_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mt5")
+
+async def run_mt5(func, *args):
+    """Виконує блокуючий виклик MT5 у потоці mt5_executor, не зупиняючи event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(mt5_executor, func, *args)
+
 # --- 3. ДОПОМІЖНІ ФУНКЦІЇ (TELEGRAM, AI, РОЗРАХУНКИ) ---
 
-async def send_telegram_message(message: str):
+# --- Пакетне надсилання повідомлень у Telegram ---
+# Повідомлення, що надходять у межах короткого вікна, об'єднуються в одне
+TELEGRAM_BATCH_FLUSH_INTERVAL = 1.5  # секунд
+TELEGRAM_MAX_BUFFER_CHARS = 3500  # Ліміт Telegram — 4096 символів, залишаємо запас
+TELEGRAM_MAX_QUEUE_CHARS = 1_000_000  # При переповненні черги найстаріші повідомлення відкидаються
+TELEGRAM_MESSAGE_LIMIT = 4096
+TELEGRAM_BATCH_SEPARATOR = "\n---\n"
+telegram_queue = asyncio.Queue()
+telegram_queue_chars = 0
+
+async def deliver_telegram_message(message: str):
     """Асинхронно надсилає повідомлення в Telegram."""
     try:
-        await telegram_bot.send_message(chat_id=TELEGRAM_CHAT_ID, text=message)
+        await telegram_bot.send_message(chat_id=TELEGRAM_CHAT_ID, text=message[:TELEGRAM_MESSAGE_LIMIT])
         logging.info(f"Надіслано повідомлення в Telegram: {message[:70]}...")
     except Exception as e:
         logging.error(f"Помилка надсилання повідомлення в Telegram: {e}")
 
-async def get_trade_signal(news_text: str) -> Optional[Tuple[str, str, str]]:
+async def send_telegram_message(message: str):
+    """Ставить повідомлення в чергу на пакетне надсилання в Telegram."""
+    global telegram_queue_chars
+    telegram_queue.put_nowait(message)
+    telegram_queue_chars += len(message)
+    while telegram_queue_chars > TELEGRAM_MAX_QUEUE_CHARS and telegram_queue.qsize() > 1:
+        dropped = telegram_queue.get_nowait()
+        telegram_queue_chars -= len(dropped)
+        logging.warning(f"Черга Telegram переповнена, повідомлення відкинуто: {dropped[:70]}...")
+
+async def telegram_sender():
+    """Збирає повідомлення з черги та надсилає їх пакетом раз на TELEGRAM_BATCH_FLUSH_INTERVAL або при заповненні буфера."""
+    global telegram_queue_chars
+    loop = asyncio.get_running_loop()
+    pending = None
+    while True:
+        message = pending if pending is not None else await telegram_queue.get()
+        pending = None
+        batch = [message]
+        size = len(message)
+        deadline = loop.time() + TELEGRAM_BATCH_FLUSH_INTERVAL
+        while size < TELEGRAM_MAX_BUFFER_CHARS:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                message = await asyncio.wait_for(telegram_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if size + len(TELEGRAM_BATCH_SEPARATOR) + len(message) > TELEGRAM_MESSAGE_LIMIT:
+                # Не влазить у поточне повідомлення — відкриє наступний пакет
+                pending = message
+                break
+            batch.append(message)
+            size += len(TELEGRAM_BATCH_SEPARATOR) + len(message)
+        telegram_queue_chars -= sum(len(m) for m in batch)
+        await deliver_telegram_message(TELEGRAM_BATCH_SEPARATOR.join(batch))
+
+# Числа в заголовку ("CPI 3.2%" проти "CPI 3.4%") ембединг майже не розрізняє, тож вони мають збігатися точно
+TITLE_NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)*")
+
+def title_numbers(title: str) -> str:
+    return " ".join(TITLE_NUMBER_RE.findall(title))
+
+class SemanticCache:
+    """Кеш торгових сигналів у SQLite з пошуком найближчого заголовка за косинусною відстанню (sqlite-vec).
+
+    Методи блокуючі й викликаються з потоків пулу (asyncio.to_thread), тому з'єднання спільне під замком.
     """
-    Надсилає новину до OpenAI Assistant і отримує торговий сигнал.
-    Повертає кортеж (ACTION, SYMBOL, REASON) або None у разі помилки.
+
+    def __init__(self, path: str, max_distance: float, ttl: float):
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.enable_load_extension(True)
+        sqlite_vec.load(self.conn)
+        self.conn.enable_load_extension(False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS signal_cache "
+            "(embedding BLOB, title TEXT, action TEXT, symbol TEXT, reason TEXT, ts REAL, numbers TEXT)"
+        )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(signal_cache)")}
+        if "numbers" not in columns:  # Старі записи без чисел (NULL) ніколи не збігаються
+            self.conn.execute("ALTER TABLE signal_cache ADD COLUMN numbers TEXT")
+        self.conn.commit()
+
+    def lookup(self, embedding, title: str) -> Optional[Tuple[str, str, str]]:
+        """Повертає сигнал найближчого незастарілого заголовка з тими ж числами або None."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT action, symbol, reason, vec_distance_cosine(embedding, ?) AS distance "
+                "FROM signal_cache WHERE ts >= ? AND numbers = ? ORDER BY distance LIMIT 1",
+                (sqlite_vec.serialize_float32(embedding), time.time() - self.ttl, title_numbers(title)),
+            ).fetchone()
+        if row is None or row[3] >= self.max_distance:
+            return None
+        return row[0], row[1], row[2]
+
+    def store(self, embedding, title: str, signal: Tuple[str, str, str]):
+        """Зберігає сигнал і видаляє записи, старші за TTL."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute("DELETE FROM signal_cache WHERE ts < ?", (now - self.ttl,))
+            self.conn.execute(
+                "INSERT INTO signal_cache (embedding, title, action, symbol, reason, ts, numbers) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (sqlite_vec.serialize_float32(embedding), title, *signal, now, title_numbers(title)),
+            )
+            self.conn.commit()
+
+try:
+    signal_cache = SemanticCache(SIGNAL_CACHE_DB, SIGNAL_CACHE_MAX_DISTANCE, SIGNAL_CACHE_TTL)
+except Exception as e:
+    logging.warning(f"Семантичний кеш сигналів вимкнено: {e}")
+    signal_cache = None
+
+exact_signal_cache = TTLCache(maxsize=EXACT_SIGNAL_CACHE_SIZE, ttl=SIGNAL_CACHE_TTL)
+
+async def embed_text(text: str) -> list:
+    """Повертає ембединг тексту (значно дешевше за повний запит сигналу)."""
+    response = await openai_client.embeddings.create(model=EMBEDDING_MODEL, input=text)
+    return response.data[0].embedding
+
+async def semantic_lookup(news_text: str):
+    """Рахує ембединг і шукає схожий заголовок у семантичному кеші; повертає (embedding, signal або None)."""
+    embedding = await embed_text(news_text)
+    cached = await asyncio.to_thread(signal_cache.lookup, embedding, news_text)
+    return embedding, cached
+
+def save_semantic_signal(embedding, news_text: str, signal: Tuple[str, str, str]):
+    try:
+        signal_cache.store(embedding, news_text, signal)
+    except Exception as e:
+        logging.warning("Не вдалося зберегти сигнал у кеш: %s", e)
+
+def finish_semantic_lookup(news_text: str, signal, task: asyncio.Task):
+    """Колбек завершення semantic_lookup: логує помилку або зберігає сигнал моделі у фоновому потоці."""
+    if task.cancelled():
+        return
+    if task.exception() is not None:
+        logging.warning("Помилка семантичного кешу: %s", task.exception())
+        return
+    if signal:
+        embedding, _ = task.result()
+        asyncio.get_running_loop().run_in_executor(None, save_semantic_signal, embedding, news_text, signal)
+
+# Інструкції для моделі; статичний системний промпт, новина передається окремим повідомленням
+SYSTEM_PROMPT = (
+    "You are a news-driven trading assistant. Analyze the news and provide a trading signal "
+    "in the format 'ACTION SYMBOL' on the first line, where ACTION is BUY, SELL or SKIP, "
+    "and a brief reason on the second."
+)
+
+# Перший рядок — рівно "ДІЯ СИМВОЛ", другий (необов'язковий) — причина
+SIGNAL_RE = re.compile(r"\s*(BUY|SELL|SKIP)[ \t]+(\S+)[ \t]*(?:\r?\n([^\r\n]*)|\Z)", re.IGNORECASE)
+
+def parse_trade_signal(response: str) -> Optional[Tuple[str, str, str]]:
+    """Розбирає відповідь моделі у кортеж (ACTION, SYMBOL, REASON)."""
+    m = SIGNAL_RE.match(response)
+    if m is None:
+        if not response.strip():
+            logging.warning("Отримана пуста відповідь від OpenAI.")
+        else:
+            logging.warning("Некоректний формат сигналу від OpenAI: %s", response.lstrip().split('\n', 1)[0])
+        return None
+
+    action, symbol, reason = m.groups()
+    reason = (reason or "").strip() or "Причина не вказана."
+
+    return action.upper(), symbol.upper().replace("/", ""), reason
+
+async def stream_signal_completion(news_text: str) -> str:
+    """
+    Запитує сигнал одним викликом Chat Completions у режимі streaming.
+    Читання припиняється, щойно отримано рядок сигналу та рядок причини
+    (для SKIP — одразу після рядка сигналу), не чекаючи решти токенів.
     """
-    logging.info(f"Надсилаю новину в OpenAI для аналізу: {news_text}")
+    stream = await openai_client.chat.completions.create(
+        model=OPENAI_MODEL,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": news_text},
+        ],
+        max_tokens=60,
+        temperature=0,
+        stream=True,
+    )
+    text = ""
     try:
-        thread = await openai_client.beta.threads.create()
-        await openai_client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=f"Analyze this news and provide a trading signal in the format 'ACTION SYMBOL' on the first line, and a brief reason on the second. News: \"{news_text}\""
-        )
-        
-        run = await openai_client.beta.threads.runs.create(
-            thread_id=thread.id,
-            assistant_id=OPENAI_ASSISTANT_ID,
-        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                text += chunk.choices[0].delta.content
+                lines = text.lstrip().split('\n')
+                if len(lines) > 2 or (len(lines) > 1 and lines[0].strip().upper().startswith("SKIP")):
+                    break
+    finally:
+        await stream.close()
+    return text
+
+# --- Пакетні запити сигналів ---
+# Новини, що надійшли протягом SIGNAL_BATCH_WINDOW після першої, аналізуються одним запитом:
+# під час сплеску (FOMC, сезон звітів) N мережевих RTT замінюються одним.
+# Поодинока новина, коли інших запитів немає, відправляється одразу, без вікна
+SIGNAL_BATCH_WINDOW = float(os.getenv("SIGNAL_BATCH_WINDOW") or 0.25)  # секунд; 0 — без очікування
+SIGNAL_BATCH_SIZE = 10
+signal_queue = asyncio.Queue()
+signal_batch_tasks = set()  # Сильні посилання на задачі пакетів, щоб їх не зібрав GC до завершення
+
+BATCH_SYSTEM_PROMPT = (
+    "You are a news-driven trading assistant. You will receive several numbered news items. "
+    "For each item reply with exactly one line in the format 'N. ACTION SYMBOL | reason', "
+    "where N is the item number and ACTION is BUY, SELL or SKIP."
+)
+BATCH_LINE_RE = re.compile(r"^\s*(\d+)[.)][ \t]*([^|\r\n]*?)[ \t]*(?:\|[ \t]*([^\r\n]*))?$", re.MULTILINE)
 
-        # Очікування завершення роботи асистента
-        start_time = time.time()
-        while run.status not in ["completed", "failed", "cancelled"]:
-            await asyncio.sleep(1)
-            run = await openai_client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
-            if time.time() - start_time > 60: # Таймаут 60 секунд
-                logging.error("OpenAI Assistant не відповів за 60 секунд.")
-                await openai_client.beta.threads.runs.cancel(thread_id=thread.id, run_id=run.id)
-                return None
-
-        if run.status == "completed":
-            messages = await openai_client.beta.threads.messages.list(thread_id=thread.id)
-            response = messages.data[0].content[0].text.value
-            logging.info(f"Отримана відповідь від OpenAI: {response}")
-            
-            # Парсинг відповіді
-            lines = response.strip().split('\n')
-            if len(lines) < 1:
-                logging.warning("Отримана пуста відповідь від OpenAI.")
-                return None
-            
-            first_line_parts = lines[0].strip().upper().split()
-            if len(first_line_parts) != 2 or first_line_parts[0] not in ["BUY", "SELL", "SKIP"]:
-                logging.warning(f"Некоректний формат сигналу від OpenAI: {lines[0]}")
-                return None
-
-            action, symbol = first_line_parts
-            reason = lines[1].strip() if len(lines) > 1 else "Причина не вказана."
-            
-            return action, symbol.replace("/", ""), reason
+async def batch_signal_completion(news_texts: list) -> list:
+    """Один виклик Chat Completions для кількох новин; повертає відповіді у форматі parse_trade_signal, у порядку новин."""
+    response = await openai_client.chat.completions.create(
+        model=OPENAI_MODEL,
+        messages=[
+            {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+            {"role": "user", "content": "\n".join(f"{i}. {text}" for i, text in enumerate(news_texts, 1))},
+        ],
+        max_tokens=60 * len(news_texts),
+        temperature=0,
+    )
+    text = response.choices[0].message.content or ""
+    answers = [""] * len(news_texts)
+    for m in BATCH_LINE_RE.finditer(text):
+        index = int(m.group(1)) - 1
+        if 0 <= index < len(answers) and not answers[index]:
+            answers[index] = f"{m.group(2)}\n{m.group(3) or ''}"
+    return answers
+
+async def run_signal_batch(batch: list):
+    """Виконує запит для пакета (news_text, future) і передає кожній новині її відповідь."""
+    # Новини, для яких сигнал уже знайшовся в семантичному кеші (future скасовано), до OpenAI не йдуть
+    batch = [(text, future) for text, future in batch if not future.done()]
+    if not batch:
+        return
+    texts = [text for text, _ in batch]
+    try:
+        if len(batch) == 1:
+            future = batch[0][1]
+            request = asyncio.ensure_future(
+                asyncio.wait_for(stream_signal_completion(texts[0]), timeout=OPENAI_SIGNAL_TIMEOUT)
+            )
+            # Влучання в кеш під час стрімінгу обриває генерацію, а не дочитує вже непотрібну відповідь
+            future.add_done_callback(lambda f: request.cancel() if f.cancelled() else None)
+            try:
+                answers = [await request]
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                return
         else:
-            logging.error(f"Робота OpenAI Assistant завершилася зі статусом: {run.status}")
-            return None
+            logging.info("Пакетний запит до OpenAI: %s новин", len(batch))
+            answers = await asyncio.wait_for(batch_signal_completion(texts), timeout=OPENAI_SIGNAL_TIMEOUT)
+    except Exception as e:
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(e)
+        return
+    for (_, future), answer in zip(batch, answers):
+        if not future.done():
+            future.set_result(answer)
+
+def finish_signal_batch(task: asyncio.Task):
+    """Колбек завершення задачі пакета: звільняє посилання і логує непередбачений виняток."""
+    signal_batch_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logging.error("Задача пакетного запиту впала: %s", task.exception())
+
+async def signal_dispatcher():
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await signal_queue.get()]
+        # Вікно має сенс лише під час сплеску: якщо інших запитів у роботі й у черзі немає, не чекаємо
+        window = SIGNAL_BATCH_WINDOW if signal_batch_tasks or not signal_queue.empty() else 0
+        deadline = loop.time() + window
+        while len(batch) < SIGNAL_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(signal_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # Кожен пакет — окрема задача, щоб збір наступного не чекав відповіді на попередній
+        task = asyncio.create_task(run_signal_batch(batch))
+        signal_batch_tasks.add(task)
+        task.add_done_callback(finish_signal_batch)
+
+async def request_signal(news_text: str) -> str:
+    """Ставить новину в чергу пакетних запитів і чекає на відповідь моделі для неї."""
+    future = asyncio.get_running_loop().create_future()
+    signal_queue.put_nowait((news_text, future))
+    # Запас понад таймаут запиту на вікно збору пакета; без нього зависла задача пакета тримала б новину вічно
+    return await asyncio.wait_for(future, timeout=OPENAI_SIGNAL_TIMEOUT + SIGNAL_BATCH_WINDOW + 1)
+
+async def get_trade_signal(news_text: str) -> Optional[Tuple[str, str, str]]:
+    """
+    Надсилає новину до OpenAI і отримує торговий сигнал.
+    Повертає кортеж (ACTION, SYMBOL, REASON) або None у разі помилки.
+    """
+    cache_key = news_text.strip().lower()
+    cached = exact_signal_cache.get(cache_key)
+    if cached is not None:
+        logging.info("Сигнал взято з точного кешу: %s %s", cached[0], cached[1])
+        return cached
 
+    logging.info("Надсилаю новину в OpenAI для аналізу: %s", news_text)
+    # Запит сигналу стартує одразу, семантичний кеш перевіряється паралельно: промах кешу (більшість заголовків)
+    # не додає до критичного шляху запит ембедингу. Влучання скасовує future у черзі — новина випадає з пакета
+    # до відправки, а вже запущений стрімінг обривається
+    signal_task = asyncio.ensure_future(request_signal(news_text))
+    semantic_task = asyncio.ensure_future(semantic_lookup(news_text)) if signal_cache is not None else None
+    signal = None
+    try:
+        if semantic_task is not None:
+            await asyncio.wait((signal_task, semantic_task), return_when=asyncio.FIRST_COMPLETED)
+            if not signal_task.done() and semantic_task.exception() is None:
+                _, cached = semantic_task.result()
+                if cached:
+                    logging.info("Сигнал взято з семантичного кешу: %s %s", cached[0], cached[1])
+                    exact_signal_cache[cache_key] = cached
+                    return cached
+        response = await signal_task
+        logging.info("Отримана відповідь від OpenAI: %s", response)
+        signal = parse_trade_signal(response)
+        if signal:
+            exact_signal_cache[cache_key] = signal
+        return signal
+
+    except asyncio.TimeoutError:
+        logging.error("OpenAI не відповів за %s секунд.", OPENAI_SIGNAL_TIMEOUT)
+        return None
     except Exception as e:
-        logging.error(f"Помилка під час взаємодії з OpenAI API: {e}")
+        logging.error("Помилка під час взаємодії з OpenAI API: %s", e)
         return None
+    finally:
+        signal_task.cancel()  # Нічого не робить, якщо відповідь уже отримана
+        if semantic_task is not None:
+            semantic_task.add_done_callback(functools.partial(finish_semantic_lookup, news_text, signal))
+
+@njit(cache=True)
+def _atr_fused(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int) -> float:
+    """
+    ATR Wilder за один прохід: True Range рахується разом зі згладжуванням, без проміжного масиву TR.
+    Початкове значення — середнє перших period значень TR, далі atr = (atr * (n - 1) + tr) / n.
+    """
+    atr = high[0] - low[0]  # Для першого бару попереднього close немає
+    for i in range(1, high.shape[0]):
+        prev_close = close[i - 1]
+        tr = high[i] - low[i]
+        up = abs(high[i] - prev_close)
+        down = abs(low[i] - prev_close)
+        if up > tr:
+            tr = up
+        if down > tr:
+            tr = down
+        if i < period:
+            atr += tr  # Сума для початкового SMA
+            if i == period - 1:
+                atr /= period
+        else:
+            atr = (atr * (period - 1) + tr) / period
+    return atr
 
 def calculate_atr(symbol: str) -> Optional[float]:
-    """Розраховує ATR для вказаного символу."""
+    """Розраховує ATR для вказаного символу (згладжування Wilder)."""
     rates = mt5.copy_rates_from_pos(symbol, ATR_TIMEFRAME, 0, ATR_PERIOD + 1)
     if rates is None or len(rates) < ATR_PERIOD:
         logging.error(f"Недостатньо даних для розрахунку ATR для {symbol}")
         return None
-    
-    df = pd.DataFrame(rates)
-    df['time'] = pd.to_datetime(df['time'], unit='s')
-    atr = df.ta.atr(length=ATR_PERIOD)
-    
-    if atr is None or atr.empty:
+
+    # Поля структурованого масиву MT5 не суцільні в пам'яті; ascontiguousarray дає ядру щільний буфер
+    # і не копіює, якщо поле вже суцільне
+    high = np.ascontiguousarray(rates['high'])
+    low = np.ascontiguousarray(rates['low'])
+    close = np.ascontiguousarray(rates['close'])
+    atr = _atr_fused(high, low, close, ATR_PERIOD)
+
+    if not np.isfinite(atr):
         logging.error(f"Не вдалося розрахувати ATR для {symbol}")
         return None
-        
-    return atr.iloc[-1]
 
-def calculate_position_size(symbol: str, sl_pips: float) -> Optional[float]:
-    """Розраховує розмір позиції на основі ризику."""
-    account_info = mt5.account_info()
-    symbol_info = mt5.symbol_info(symbol)
+    return float(atr)
+
+# --- Кеш метаданих символів ---
+# point, tick_size, volume_step, min/max лот не змінюються протягом торгової сесії,
+# але trade_tick_value для крос-валютних символів рухається разом із курсом, тож TTL короткий
+SYMBOL_INFO_CACHE_TTL = 30  # секунд
+_symbol_info_cache = {}
+_symbol_info_cache_ts = {}
+
+def get_symbol_info(symbol: str, ttl: float = SYMBOL_INFO_CACHE_TTL):
+    """Повертає mt5.symbol_info з кешу, звертаючись до терміналу не частіше ніж раз на ttl секунд.
+
+    symbol_info_tick тут не кешується — це живі котирування.
+    """
+    now = time.monotonic()
+    cached_at = _symbol_info_cache_ts.get(symbol)
+    if cached_at is not None and now - cached_at < ttl:
+        return _symbol_info_cache[symbol]
+    info = mt5.symbol_info(symbol)
+    if info is not None:
+        _symbol_info_cache[symbol] = info
+        _symbol_info_cache_ts[symbol] = now
+    return info
+
+# --- Символи, доступні для торгівлі ---
+# Видимі у терміналі символи збираються один раз і оновлюються раз на годину,
+# тож невідомий символ від OpenAI відхиляється без звернення до MT5
+TRADABLE_SYMBOLS_REFRESH_INTERVAL = 3600  # секунд
+tradable_symbols = frozenset()
 
+def refresh_tradable_symbols():
+    """Оновлює множину видимих у терміналі символів."""
+    global tradable_symbols
+    symbols = mt5.symbols_get()
+    if symbols is None:
+        logging.error(f"Не вдалося отримати список символів MT5: {mt5.last_error()}")
+        return
+    tradable_symbols = frozenset(s.name for s in symbols if s.visible)
+    logging.info(f"Доступних для торгівлі символів: {len(tradable_symbols)}")
+
+async def tradable_symbols_refresher():
+    while True:
+        await asyncio.sleep(TRADABLE_SYMBOLS_REFRESH_INTERVAL)
+        await run_mt5(refresh_tradable_symbols)
+
+def calculate_position_size(symbol_info, account_info, sl_pips: float, risk_percent: float = RISK_PERCENT) -> Optional[float]:
+    """Розраховує розмір позиції на основі ризику."""
     if account_info is None or symbol_info is None:
         logging.error("Не вдалося отримати інформацію про рахунок або символ.")
         return None
 
+    symbol = symbol_info.name
+
     balance = account_info.balance
-    risk_amount = balance * (RISK_PERCENT / 100.0)
+    risk_amount = balance * (risk_percent / 100.0)
     
     # Отримуємо вартість одного пункту для одного лота
     # mt5.symbol_info_tick(...).point - розмір пункту (напр. 0.00001)
@@ -312,17 +830,16 @@ def calculate_position_size(symbol: str, sl_pips: float) -> Optional[float]:
 
     return lot_size
 
-def check_market_conditions(symbol: str) -> bool:
-    """Перевіряє ринкові умови: ліквідність, спред, час."""
-    now = datetime.datetime.utcnow()
+def is_liquid_hour(now: datetime.datetime) -> bool:
+    """Перевіряє час торгівлі; не потребує терміналу, тож виконується до будь-яких запитів до MT5."""
     if now.hour < MIN_LIQUIDITY_HOUR:
         logging.info(f"Не торгуємо вночі (UTC < {MIN_LIQUIDITY_HOUR})")
         return False
-    tick = mt5.symbol_info_tick(symbol)
-    symbol_info = mt5.symbol_info(symbol)
-    if not tick or not symbol_info:
-        logging.warning(f"Не вдалося отримати tick/symbol_info для {symbol}")
-        return False
+    return True
+
+def check_spread(symbol_info, tick) -> bool:
+    """Перевіряє спред за вже отриманими symbol_info і tick."""
+    symbol = symbol_info.name
     spread = abs(tick.ask - tick.bid) / symbol_info.point
     if spread > MAX_SPREAD_POINTS:
         logging.info(f"Завеликий спред для {symbol}: {spread} пунктів")
@@ -331,43 +848,68 @@ def check_market_conditions(symbol: str) -> bool:
 
 # --- 4. ОСНОВНА ТОРГОВА ЛОГІКА ---
 
-async def execute_trade(action: str, symbol: str, reason: str, news_received_time=None):
-    openai_response_time = datetime.datetime.utcnow()
+# Константи MT5 і незмінні поля запиту на ордер обчислюються один раз при завантаженні
+ORDER_BUY = mt5.ORDER_TYPE_BUY
+ORDER_SELL = mt5.ORDER_TYPE_SELL
+RETCODE_DONE = mt5.TRADE_RETCODE_DONE
+ORDER_REQUEST_TEMPLATE = {
+    "action": mt5.TRADE_ACTION_DEAL,
+    "deviation": 10,
+    "magic": MAGIC_NUMBER,
+    "type_time": mt5.ORDER_TIME_GTC,
+    "type_filling": mt5.ORDER_FILLING_IOC,
+}
+
+async def execute_trade(action: str, symbol: str, reason: str, risk_percent: float = RISK_PERCENT, news_received_ns=None):
     logging.info(f"Починаю процес відкриття угоди: {action} {symbol}")
 
     # --- Захист від дублювання угод ---
-    with open_positions_lock:
+    async with open_positions_lock:
         if symbol in open_positions:
             logging.info(f"Вже є відкрита позиція по {symbol}, нову не відкриваємо.")
             return
         open_positions.add(symbol)
 
     try:
+        if not is_liquid_hour(datetime.datetime.now(_UTC)):
+            logging.info(f"Ринкові умови не підходять для {symbol}, угода не відкривається.")
+            return
         if not can_trade(symbol):
             logging.info(f"Ліміт або cooldown: угода не відкривається.")
             return
-        if not check_market_conditions(symbol):
-            logging.info(f"Ринкові умови не підходять для {symbol}, угода не відкривається.")
-            return
-        
-        symbol_info = mt5.symbol_info(symbol)
-        if not symbol_info or not symbol_info.visible:
+        if symbol not in tradable_symbols:
             msg = f"⚠️ Помилка: Символ {symbol} не знайдено або він не доступний для торгівлі у вашого брокера."
             logging.error(msg)
             await send_telegram_message(msg)
             return
-        atr_value = calculate_atr(symbol)
-        if atr_value is None:
-            msg = f"⚠️ Помилка: Не вдалося розрахувати ATR для {symbol}."
+        # Спершу лише те, що потрібно для перевірки спреду; ATR і рахунок не запитуються, якщо спред завеликий
+        symbol_info, tick = await asyncio.gather(
+            run_mt5(get_symbol_info, symbol),
+            run_mt5(mt5.symbol_info_tick, symbol),
+        )
+        if not symbol_info:
+            msg = f"⚠️ Помилка: Не вдалося отримати інформацію про символ {symbol}."
             logging.error(msg)
             await send_telegram_message(msg)
             return
-        tick = mt5.symbol_info_tick(symbol)
         if tick is None:
             msg = f"⚠️ Помилка: Не вдалося отримати поточну ціну для {symbol}."
             logging.error(msg)
             await send_telegram_message(msg)
             return
+        if not check_spread(symbol_info, tick):
+            logging.info(f"Ринкові умови не підходять для {symbol}, угода не відкривається.")
+            return
+        # Незалежні запити до терміналу ставляться в чергу MT5 одразу, без очікування один одного
+        atr_value, account_info = await asyncio.gather(
+            run_mt5(calculate_atr, symbol),
+            run_mt5(mt5.account_info),
+        )
+        if atr_value is None:
+            msg = f"⚠️ Помилка: Не вдалося розрахувати ATR для {symbol}."
+            logging.error(msg)
+            await send_telegram_message(msg)
+            return
         price = tick.ask if action == "BUY" else tick.bid
         point = symbol_info.point
         # --- Трейлінг-стоп (додаємо до SL, якщо потрібно) ---
@@ -382,34 +924,33 @@ async def execute_trade(action: str, symbol: str, reason: str, news_received_tim
             take_profit = price - (atr_value * ATR_TP_MULTIPLIER)
             trailing_sl = price + trailing_stop
         sl_pips = abs(price - stop_loss) / point
-        volume = calculate_position_size(symbol, sl_pips)
+        volume = calculate_position_size(symbol_info, account_info, sl_pips, risk_percent)
         if volume is None or volume == 0:
             msg = f"⚠️ Помилка: Не вдалося розрахувати розмір позиції для {symbol}."
             logging.error(msg)
             await send_telegram_message(msg)
             return
-        request = {
-            "action": mt5.TRADE_ACTION_DEAL,
-            "symbol": symbol,
-            "volume": volume,
-            "type": mt5.ORDER_TYPE_BUY if action == "BUY" else mt5.ORDER_TYPE_SELL,
-            "price": price,
-            "sl": stop_loss,
-            "tp": take_profit,
-            "deviation": 10,
-            "magic": MAGIC_NUMBER,
-            "comment": f"NewsBot: {reason[:20]}",
-            "type_time": mt5.ORDER_TIME_GTC,
-            "type_filling": mt5.ORDER_FILLING_IOC,
-        }
-        trade_sent_time = datetime.datetime.utcnow()
-        latency = (trade_sent_time - news_received_time).total_seconds() if news_received_time else None
-        result = mt5.order_send(request)
+        request = ORDER_REQUEST_TEMPLATE.copy()
+        request.update(
+            symbol=symbol,
+            volume=volume,
+            type=ORDER_BUY if action == "BUY" else ORDER_SELL,
+            price=price,
+            sl=stop_loss,
+            tp=take_profit,
+            comment=f"NewsBot: {reason[:20]}",
+        )
+        # Затримка рахується за монотонним годинником; wallclock потрібен лише для open_time у журналі
+        latency = (time.monotonic_ns() - news_received_ns) / 1e9 if news_received_ns else None
+        trade_sent_time = datetime.datetime.now(_UTC)
+        result = await run_mt5(mt5.order_send, request)
         if result is None:
             msg = f"❌ Помилка відкриття ордеру для {symbol}. Код: Невідома помилка."
             logging.error(msg)
             await send_telegram_message(msg)
-        elif result.retcode == mt5.TRADE_RETCODE_DONE:
+        elif result.retcode == RETCODE_DONE:
+            register_trade()
+            deal_event.set()
             msg = (
                 f"✅ Угоду відкрито: {action} {symbol}\n"
                 f"🔹 Ціна входу: {result.price}\n"
@@ -448,121 +989,203 @@ async def execute_trade(action: str, symbol: str, reason: str, news_received_tim
         await send_telegram_message(f"❌ Помилка під час виконання угоди: {e}")
     finally:
         # Видаляємо символ з відкритих позицій
-        with open_positions_lock:
+        async with open_positions_lock:
             open_positions.discard(symbol)
 
-# --- Відстеження закриття угод ---
-async def monitor_closed_trades():
-    global cooldown_until
-    last_ticket_set = set()
-    while True:
-        try:
-            closed_orders = mt5.history_deals_get(datetime.datetime.now() - datetime.timedelta(days=2), datetime.datetime.now())
-            if closed_orders:
-                for deal in closed_orders:
-                    if deal.type in [mt5.DEAL_TYPE_BUY, mt5.DEAL_TYPE_SELL] and deal.entry == 1:  # закриття позиції
-                        if deal.ticket not in last_ticket_set:
-                            last_ticket_set.add(deal.ticket)
-                            profit = deal.profit
-                            if profit < 0:
-                                cooldown_until = datetime.datetime.utcnow() + datetime.timedelta(seconds=COOLDOWN_AFTER_LOSS)
-                            msg = (
-                                f"❌ Угоду закрито: {deal.symbol}\n"
-                                f"Тип: {'BUY' if deal.type == mt5.DEAL_TYPE_BUY else 'SELL'}\n"
-                                f"Об'єм: {deal.volume}\n"
-                                f"Ціна закриття: {deal.price}\n"
-                                f"Прибуток: {profit}"
-                            )
-                            await send_telegram_message(msg)
-                            log_trade_result({
-                                "type": "close",
-                                "ticket": deal.ticket,
-                                "symbol": deal.symbol,
-                                "action": 'BUY' if deal.type == mt5.DEAL_TYPE_BUY else 'SELL',
-                                "volume": deal.volume,
-                                "close_price": deal.price,
-                                "profit": profit,
-                                "close_time": datetime.datetime.utcfromtimestamp(deal.time).isoformat()
-                            })
-            await asyncio.sleep(5)
-        except Exception as e:
-            logging.error(f"Помилка моніторингу закриття угод: {e}")
-            await asyncio.sleep(10)
-
-
 # --- 5. ГОЛОВНИЙ ЦИКЛ (ПРОСЛУХОВОВАННЯ WEBSOCKET) ---
 
 async def process_news_item(news_data: dict):
     try:
-        title = news_data.get('title', '').lower()
-        news_received_time = datetime.datetime.utcnow()
+        news_received_ns = time.monotonic_ns()
         # --- Розширена фільтрація ---
+        # Спершу найдешевші перевірки (ціле число, рядок), сканування ключових слів — лише для решти
         filtered = False
         reason = None
-        if any(bad in title for bad in NEWS_BLACKLIST):
-            filtered = True
-            reason = "blacklist"
-            log_news(news_data, filtered, reason)
-            logging.info(f"Новина проігнорована через blacklist: {news_data.get('title')}")
-            return
-        if not any(good in title for good in NEWS_WHITELIST):
-            filtered = True
-            reason = "not in whitelist"
-            log_news(news_data, filtered, reason)
-            logging.info(f"Новина не містить whitelist-ключових слів: {news_data.get('title')}")
-            return
         impact = news_data.get('importance', 1)
         if impact < MIN_NEWS_IMPORTANCE:
             filtered = True
             reason = f"impact={impact}"
             log_news(news_data, filtered, reason)
-            logging.info(f"Новина має низьку важливість (impact={impact}): {news_data.get('title')}")
+            logging.info("Новина має низьку важливість (impact=%s): %s", impact, news_data.get('title'))
             return
         news_type = news_data.get('type', '').lower()
         if news_type and news_type not in IMPORTANT_NEWS_TYPES:
             filtered = True
             reason = f"type={news_type}"
             log_news(news_data, filtered, reason)
-            logging.info(f"Новина не входить до важливих типів: {news_data.get('title')}")
+            logging.info("Новина не входить до важливих типів: %s", news_data.get('title'))
+            return
+        title = news_data.get('title', '').lower()
+        if matches_blacklist(title):
+            filtered = True
+            reason = "blacklist"
+            log_news(news_data, filtered, reason)
+            logging.info("Новина проігнорована через blacklist: %s", news_data.get('title'))
+            return
+        if not matches_whitelist(title):
+            filtered = True
+            reason = "not in whitelist"
+            log_news(news_data, filtered, reason)
+            logging.info("Новина не містить whitelist-ключових слів: %s", news_data.get('title'))
             return
         log_news(news_data, False)
-        logging.info(f"Знайдено важливу новину: {news_data.get('title')}")
-        global RISK_PERCENT
-        RISK_PERCENT = dynamic_risk_percent(news_data)
+        logging.info("Знайдено важливу новину: %s", news_data.get('title'))
+        risk_percent = dynamic_risk_percent(news_data)
         signal_data = await get_trade_signal(news_data.get('title'))
-        openai_response_time = datetime.datetime.utcnow()
-        logging.info(f"OpenAI latency: {(openai_response_time - news_received_time).total_seconds():.2f} сек.")
+        logging.info("OpenAI latency: %.2f сек.", (time.monotonic_ns() - news_received_ns) / 1e9)
         if signal_data:
             action, symbol, reason = signal_data
             if action in ["BUY", "SELL"]:
-                asyncio.create_task(execute_trade(action, symbol, reason, news_received_time=news_received_time))
+                task = asyncio.create_task(execute_trade_limited(action, symbol, reason, risk_percent, news_received_ns=news_received_ns))
+                trade_tasks.add(task)
+                task.add_done_callback(finish_trade_task)
             else:
-                logging.info(f"Отримано сигнал SKIP для новини. Торгівлю пропущено.")
+                logging.info("Отримано сигнал SKIP для новини. Торгівлю пропущено.")
     except Exception as e:
-        logging.error(f"Критична помилка в обробці новини: {e}")
+        logging.error("Критична помилка в обробці новини: %s", e)
+
+
+# --- Обмежений пул обробників новин ---
+# Джерело новин лише ставить їх у чергу; обробляє фіксована кількість воркерів,
+# тож під час шторму новин не створюються сотні одночасних запитів до OpenAI та MT5
+NEWS_WORKERS = 8
+NEWS_QUEUE_SIZE = 100  # При переповненні найстаріша новина відкидається
+MAX_CONCURRENT_TRADES = 4
+news_queue = asyncio.Queue(maxsize=NEWS_QUEUE_SIZE)
+trade_semaphore = asyncio.Semaphore(MAX_CONCURRENT_TRADES)
+trade_tasks = set()  # Сильні посилання на задачі угод, щоб ордер у процесі не зібрав GC
 
+def enqueue_news(news_data: dict):
+    """Ставить новину в чергу обробки, відкидаючи найстарішу при переповненні."""
+    if news_queue.full():
+        dropped = news_queue.get_nowait()
+        logging.warning("Черга новин переповнена, новину відкинуто: %s", dropped.get('title'))
+    news_queue.put_nowait(news_data)
+
+async def news_worker():
+    while True:
+        news_data = await news_queue.get()
+        await process_news_item(news_data)
+
+def finish_trade_task(task: asyncio.Task):
+    """Колбек завершення задачі угоди: звільняє посилання і логує скасування під час зупинки або виняток."""
+    trade_tasks.discard(task)
+    if task.cancelled():
+        logging.warning("Задачу відкриття угоди скасовано під час зупинки бота")
+    elif task.exception() is not None:
+        logging.error("Задача відкриття угоди впала: %s", task.exception())
+
+async def execute_trade_limited(action: str, symbol: str, reason: str, risk_percent: float = RISK_PERCENT, news_received_ns=None):
+    """Виконує угоду, обмежуючи кількість одночасних угод MAX_CONCURRENT_TRADES."""
+    async with trade_semaphore:
+        await execute_trade(action, symbol, reason, risk_percent, news_received_ns=news_received_ns)
 
 # --- Polygon.io REST API polling ---
 POLYGON_NEWS_URL = "https://api.polygon.io/v2/reference/news"
-last_polygon_news_id = None
+POLYGON_NEWS_LIMIT = 20  # Кілька новин за запит, щоб не втратити ті, що вийшли між опитуваннями
+
+class PolygonNewsPage(msgspec.Struct):
+    """Відповідь Polygon з новинами; поля конверта, крім results, пропускаються без створення об'єктів."""
+    results: list[dict] = msgspec.field(default_factory=list)
+
+polygon_news_decoder = msgspec.json.Decoder(PolygonNewsPage)
+
+class BoundedSeenSet:
+    """Множина останніх maxsize ключів; найдавніше використаний ключ витісняється першим (LRU)."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._keys = collections.OrderedDict()
+
+    def add(self, key) -> bool:
+        """Запам'ятовує ключ; повертає False, якщо він уже був (і оновлює його позицію)."""
+        if key in self._keys:
+            self._keys.move_to_end(key)
+            return False
+        self._keys[key] = None
+        if len(self._keys) > self.maxsize:
+            self._keys.popitem(last=False)
+        return True
+
+# --- Захист від повторної обробки новин ---
+# Оновлення та повторні публікації тієї ж новини відсікаються до фільтрації та запиту в OpenAI
+SEEN_NEWS_MAX = 10000
+seen_news_ids = BoundedSeenSet(SEEN_NEWS_MAX)
+
+def is_new_news(news_id) -> bool:
+    """Запам'ятовує ID новини; повертає False, якщо вона вже оброблялась."""
+    return seen_news_ids.add(news_id)
 
 async def polygon_news_poller():
-    global last_polygon_news_id
+    # Одна сесія на весь час роботи: TCP/TLS-з'єднання перевикористовується між запитами
+    connector = aiohttp.TCPConnector(limit=4, ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=5)
+    etag = None
+    primed = False
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        while True:
+            try:
+                params = {"apiKey": POLYGON_API_KEY, "limit": POLYGON_NEWS_LIMIT}
+                headers = {"If-None-Match": etag} if etag else None
+                async with session.get(POLYGON_NEWS_URL, params=params, headers=headers) as response:
+                    if response.status == 304:  # Нічого нового — тіло відповіді не розбираємо
+                        results = []
+                    else:
+                        etag = response.headers.get("ETag")
+                        results = polygon_news_decoder.decode(await response.read()).results
+                if results and not primed:
+                    # Під час старту, як і раніше, обробляємо лише найсвіжішу новину, решту — позначаємо баченими
+                    for news in results[1:]:
+                        is_new_news(news["id"])
+                    results = results[:1]
+                    primed = True
+                # Polygon віддає новини від найновішої, тож обробляємо у хронологічному порядку
+                for news in reversed(results):
+                    if is_new_news(news["id"]):
+                        logging.info("НОВА НОВИНА (Polygon): %s", news['title'])
+                        enqueue_news(news)
+            except Exception as e:
+                logging.error("Помилка отримання новин Polygon: %s", e)
+            await asyncio.sleep(2)  # polling кожні 2 секунди
+
+# --- Polygon.io WebSocket stream ---
+# Push-потік прибирає 2-секундну затримку опитування; REST-поллер лишається запасним режимом
+NEWS_FEED_MODE = (os.getenv("NEWS_FEED_MODE") or "rest").lower()  # "ws" — WebSocket, "rest" — опитування REST
+POLYGON_WS_URL = os.getenv("POLYGON_WS_URL") or "wss://socket.polygon.io/stocks"
+POLYGON_WS_CHANNEL = "news.*"
+WS_RECONNECT_MIN_DELAY = 1  # секунд
+WS_RECONNECT_MAX_DELAY = 60  # секунд
+
+polygon_ws_decoder = msgspec.json.Decoder(list[dict])
+
+async def polygon_news_ws():
+    """Отримує новини з WebSocket Polygon; після розриву перепідключається з експоненційною затримкою."""
+    delay = WS_RECONNECT_MIN_DELAY
     while True:
         try:
-            params = {"apiKey": POLYGON_API_KEY, "limit": 1}
-            response = requests.get(POLYGON_NEWS_URL, params=params)
-            data = response.json()
-            results = data.get("results", [])
-            if results:
-                news = results[0]
-                if news["id"] != last_polygon_news_id:
-                    last_polygon_news_id = news["id"]
-                    logging.info(f"НОВА НОВИНА (Polygon): {news['title']}")
-                    await process_news_item(news)
+            async with websockets.connect(POLYGON_WS_URL, ping_interval=20) as ws:
+                await ws.send(json.dumps({"action": "auth", "params": POLYGON_API_KEY}))
+                await ws.send(json.dumps({"action": "subscribe", "params": POLYGON_WS_CHANNEL}))
+                async for message in ws:
+                    for event in polygon_ws_decoder.decode(message):
+                        if event.get("ev") == "status":
+                            status = event.get("status")
+                            if status == "auth_failed":
+                                raise RuntimeError(f"авторизація не вдалася: {event.get('message')}")
+                            if status == "auth_success":
+                                delay = WS_RECONNECT_MIN_DELAY
+                            logging.info("Polygon WebSocket: %s", event.get("message"))
+                            continue
+                        news_id = event.get("id")
+                        if news_id is not None and is_new_news(news_id):
+                            logging.info("НОВА НОВИНА (Polygon WS): %s", event.get('title'))
+                            enqueue_news(event)
+            logging.warning("WebSocket Polygon закрито сервером")
         except Exception as e:
-            logging.error(f"Помилка отримання новин Polygon: {e}")
-        await asyncio.sleep(2)  # polling кожні 2 секунди
+            logging.error("Помилка WebSocket Polygon: %s", e)
+        logging.info("Перепідключення до WebSocket Polygon через %s сек.", delay)
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, WS_RECONNECT_MAX_DELAY)
 
 # --- Telegram-інтерфейс ---
 MAX_TRADES_PER_DAY = 10
@@ -570,18 +1193,27 @@ COOLDOWN_AFTER_LOSS = 600  # секунд (10 хвилин)
 last_trade_time = None
 last_trade_profit = 0
 cooldown_until = None
-trade_counter = {}
+# Лічильник угод за поточний день UTC: [кількість, ordinal дати]; скидається при зміні дати
+trade_counter = [0, datetime.datetime.now(_UTC).date().toordinal()]
+
+def read_trades_for_day(day: str) -> list:
+    """Повертає записи журналу угод за дату day (YYYY-MM-DD); блокуюче читання файлу."""
+    return [t for t in read_jsonl(TRADE_LOG_FILE) if t.get("open_time", "").startswith(day)]
+
+def read_last_trade_line() -> Optional[str]:
+    """Повертає останній непорожній рядок журналу угод або None; блокуюче читання файлу."""
+    if not os.path.exists(TRADE_LOG_FILE):
+        return None
+    with open(TRADE_LOG_FILE, "r", encoding="utf-8") as f:
+        # Лише останній рядок, без завантаження всього файлу
+        return next(iter(collections.deque((line for line in f if line.strip()), maxlen=1)), None)
 
 async def stats_command(update, context):
     """Відправляє статистику за день."""
     try:
-        today = datetime.datetime.utcnow().date()
-        if os.path.exists(TRADE_LOG_FILE):
-            with open(TRADE_LOG_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-        else:
-            data = []
-        trades_today = [t for t in data if t.get("open_time", "").startswith(str(today))]
+        today = datetime.datetime.now(_UTC).date()
+        # Читання журналу — у потоці, щоб не блокувати цикл подій торгового шляху
+        trades_today = await asyncio.to_thread(read_trades_for_day, str(today))
         profit = sum(t.get("profit", 0) for t in trades_today if t["type"] == "close")
         msg = f"Статистика за {today} UTC:\nКількість угод: {len(trades_today)}\nСумарний прибуток: {profit:.2f}"
         await update.message.reply_text(msg)
@@ -591,15 +1223,11 @@ async def stats_command(update, context):
 async def last_command(update, context):
     """Відправляє інформацію про останню угоду."""
     try:
-        if os.path.exists(TRADE_LOG_FILE):
-            with open(TRADE_LOG_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-        else:
-            data = []
-        if not data:
+        last_line = await asyncio.to_thread(read_last_trade_line)
+        if last_line is None:
             await update.message.reply_text("Ще не було жодної угоди.")
             return
-        last = data[-1]
+        last = json.loads(last_line)
         msg = f"Остання угода:\n{json.dumps(last, ensure_ascii=False, indent=2)}"
         await update.message.reply_text(msg)
     except Exception as e:
@@ -612,13 +1240,9 @@ async def help_command(update, context):
 # --- Ліміти та cooldown ---
 def can_trade(symbol):
     global cooldown_until
-    now = datetime.datetime.utcnow()
-    today = now.date()
+    now = datetime.datetime.now(_UTC)
     # Ліміт угод на день
-    if today not in trade_counter:
-        trade_counter.clear()
-        trade_counter[today] = 0
-    if trade_counter[today] >= MAX_TRADES_PER_DAY:
+    if today_trade_count(now.date().toordinal()) >= MAX_TRADES_PER_DAY:
         logging.info(f"Досягнуто ліміту угод на день: {MAX_TRADES_PER_DAY}")
         return False
     # Cooldown
@@ -627,12 +1251,17 @@ def can_trade(symbol):
         return False
     return True
 
+def today_trade_count(today: int) -> int:
+    """Повертає кількість угод за день today (ordinal), обнуляючи лічильник після зміни дати."""
+    if trade_counter[1] != today:
+        trade_counter[:] = [0, today]
+    return trade_counter[0]
+
 def register_trade():
-    today = datetime.datetime.utcnow().date()
-    if today not in trade_counter:
-        trade_counter.clear()
-        trade_counter[today] = 0
-    trade_counter[today] += 1
+    today = datetime.datetime.now(_UTC).date().toordinal()
+    if trade_counter[1] != today:
+        trade_counter[:] = [0, today]
+    trade_counter[0] += 1
 
 # --- Симулятор (структура для майбутнього) ---
 def run_simulation(news_history, strategy_func):
@@ -648,82 +1277,225 @@ def run_simulation(news_history, strategy_func):
 
 # --- Інтеграція Telegram-бота ---
 telegram_app = None
+# Фонові задачі після збою перезапускаються з паузою, що подвоюється до цього значення (±20% джитеру),
+# а не завершуються мовчки, залишаючи бота напівживим
+TASK_RESTART_MIN_BACKOFF = 1  # секунд
+TASK_RESTART_MAX_BACKOFF = 60  # секунд
 
-def start_telegram_bot():
+async def run_telegram_bot():
+    """Обробляє команди Telegram у головному event loop, поруч з іншими задачами, без окремого потоку."""
     global telegram_app
-    telegram_app = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
-    telegram_app.add_handler(CommandHandler("stats", stats_command))
-    telegram_app.add_handler(CommandHandler("last", last_command))
-    telegram_app.add_handler(CommandHandler("help", help_command))
-    # Виправляємо помилку з event loop
-    import asyncio
-    try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        telegram_app.run_polling()
-    except Exception as e:
-        logging.error(f"Помилка запуску Telegram-бота: {e}")
+    backoff = TASK_RESTART_MIN_BACKOFF
+    while True:
+        telegram_app = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+        telegram_app.add_handler(CommandHandler("stats", stats_command))
+        telegram_app.add_handler(CommandHandler("last", last_command))
+        telegram_app.add_handler(CommandHandler("help", help_command))
+        try:
+            async with telegram_app:  # initialize() / shutdown()
+                await telegram_app.start()
+                await telegram_app.updater.start_polling()
+                backoff = TASK_RESTART_MIN_BACKOFF
+                try:
+                    await asyncio.Event().wait()  # Працюємо до скасування main()
+                finally:
+                    await telegram_app.updater.stop()
+                    await telegram_app.stop()
+        except Exception as e:
+            logging.error(f"Помилка запуску Telegram-бота: {e}; повтор через {backoff} с")
+            await asyncio.sleep(backoff * random.uniform(0.8, 1.2))
+            backoff = min(backoff * 2, TASK_RESTART_MAX_BACKOFF)
 
 # --- Модифікація monitor_closed_trades для cooldown ---
-async def monitor_closed_trades():
+# Курсор — час останньої отриманої угоди (епоха сервера MT5); вікно включає цю секунду,
+# а повтори на межі відсікає is_new_deal. Верхня межа з запасом: час сервера може випереджати локальний
+DEAL_QUERY_AHEAD = 86400  # секунд
+DEAL_STARTUP_LOOKBACK = 300  # секунд
+SEEN_DEALS_MAX = 4096
+last_deal_time = int(time.time()) - DEAL_STARTUP_LOOKBACK
+last_deal_total = None  # Кількість угод у вікні від last_deal_time під час останнього повного запиту
+seen_deal_tickets = BoundedSeenSet(SEEN_DEALS_MAX)
+
+def is_new_deal(ticket) -> bool:
+    """Запам'ятовує тікет угоди; повертає False, якщо закриття вже оброблялось."""
+    return seen_deal_tickets.add(ticket)
+
+# Опитування з наростаючою паузою: 1 с після нових угод, подвоюється до DEAL_POLL_INTERVAL, поки угод немає.
+# deal_event будить монітор одразу, щойно бот сам відкрив угоду (колбеків подій MT5 у Python API немає)
+DEAL_POLL_MIN_INTERVAL = 1  # секунд
+DEAL_POLL_MAX_INTERVAL = float(os.getenv("DEAL_POLL_INTERVAL") or 30)  # секунд; єдиний параметр частоти опитування
+DEAL_ERROR_MAX_BACKOFF = 60  # секунд; пауза після помилок MT5 росте до цього значення і має ±20% джитеру
+deal_event = asyncio.Event()
+
+# Сторона угоди і шаблон повідомлення прив'язуються один раз при завантаженні
+_DEAL_BUY = mt5.DEAL_TYPE_BUY
+_DEAL_SELL = mt5.DEAL_TYPE_SELL
+_DEAL_ENTRY_OUT = mt5.DEAL_ENTRY_OUT  # Угода закриття позиції
+_DEAL_SIDE = {_DEAL_BUY: 'BUY', _DEAL_SELL: 'SELL'}
+CLOSED_DEAL_TEMPLATE = (
+    "❌ Угоду закрито: {symbol}\n"
+    "Тип: {action}\n"
+    "Об'єм: {volume}\n"
+    "Ціна закриття: {close_price}\n"
+    "Прибуток: {profit}"
+)
+
+async def report_closed_deal(deal):
+    """Оновлює cooldown, надсилає повідомлення та пише в журнал закриття угоди."""
     global cooldown_until
-    last_ticket_set = set()
+    profit = deal.profit
+    if profit < 0:
+        cooldown_until = datetime.datetime.now(_UTC) + datetime.timedelta(seconds=COOLDOWN_AFTER_LOSS)
+    record = {
+        "type": "close",
+        "ticket": deal.ticket,
+        "symbol": deal.symbol,
+        "action": _DEAL_SIDE[deal.type],
+        "volume": deal.volume,
+        "close_price": deal.price,
+        "profit": profit,
+        # Той самий рядок, що й utcfromtimestamp(...).isoformat() у старих записах, без проміжного datetime
+        "close_time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(deal.time))
+    }
+    await send_telegram_message(CLOSED_DEAL_TEMPLATE.format_map(record))
+    log_trade_result(record)
+
+def closing_deals(deals) -> list:
+    """Повертає угоди закриття позицій (BUY/SELL з entry OUT) у порядку історії."""
+    return [deal for deal in deals if deal.type in _DEAL_SIDE and deal.entry == _DEAL_ENTRY_OUT]
+
+async def scan_closed_deals() -> Optional[int]:
+    """Обробляє нові закриття угод з last_deal_time; повертає їх кількість або None, якщо MT5 не віддав історію."""
+    global last_deal_time, last_deal_total
+    until = int(time.time()) + DEAL_QUERY_AHEAD
+    # Дешевий лічильник замість повного списку: якщо кількість угод у вікні не змінилась, нових немає
+    total = await run_mt5(mt5.history_deals_total, last_deal_time, until)
+    if total is not None and total == last_deal_total:
+        return 0
+    closed_orders = await run_mt5(mt5.history_deals_get, last_deal_time, until)
+    if closed_orders is None:
+        code, description = await run_mt5(mt5.last_error)
+        if code == mt5.RES_S_OK:  # Угод у вікні просто немає
+            last_deal_total = total
+            return 0
+        if code <= mt5.RES_E_INTERNAL_FAIL:  # Помилки IPC: зв'язок з терміналом втрачено
+            logging.error(f"Втрачено зв'язок з терміналом MT5 ({code}: {description}), перепідключаюсь")
+            await run_mt5(mt5.initialize)
+        else:
+            logging.error(f"MT5 не повернув історію угод ({code}: {description})")
+        return None
+    if closed_orders:
+        last_deal_time = max(last_deal_time, max(deal.time for deal in closed_orders))
+    # Після зсуву курсора вікно інше, тож лічильник рахуємо від нового початку
+    last_deal_total = sum(1 for deal in closed_orders if deal.time >= last_deal_time)
+    new_deals = 0
+    for deal in closing_deals(closed_orders):
+        if is_new_deal(deal.ticket):
+            await report_closed_deal(deal)
+            new_deals += 1
+    return new_deals
+
+async def monitor_closed_trades():
+    # Інкрементальний запит: лише угоди з часу останньої отриманої, а не вся історія за 2 дні
+    backoff = DEAL_POLL_MIN_INTERVAL
+    error_backoff = DEAL_POLL_MIN_INTERVAL
     while True:
+        deal_event.clear()
         try:
-            closed_orders = mt5.history_deals_get(datetime.datetime.now() - datetime.timedelta(days=2), datetime.datetime.now())
-            if closed_orders:
-                for deal in closed_orders:
-                    if deal.type in [mt5.DEAL_TYPE_BUY, mt5.DEAL_TYPE_SELL] and deal.entry == 1:
-                        if deal.ticket not in last_ticket_set:
-                            last_ticket_set.add(deal.ticket)
-                            profit = deal.profit
-                            if profit < 0:
-                                cooldown_until = datetime.datetime.utcnow() + datetime.timedelta(seconds=COOLDOWN_AFTER_LOSS)
-                            msg = (
-                                f"❌ Угоду закрито: {deal.symbol}\n"
-                                f"Тип: {'BUY' if deal.type == mt5.DEAL_TYPE_BUY else 'SELL'}\n"
-                                f"Об'єм: {deal.volume}\n"
-                                f"Ціна закриття: {deal.price}\n"
-                                f"Прибуток: {profit}"
-                            )
-                            await send_telegram_message(msg)
-                            log_trade_result({
-                                "type": "close",
-                                "ticket": deal.ticket,
-                                "symbol": deal.symbol,
-                                "action": 'BUY' if deal.type == mt5.DEAL_TYPE_BUY else 'SELL',
-                                "volume": deal.volume,
-                                "close_price": deal.price,
-                                "profit": profit,
-                                "close_time": datetime.datetime.utcfromtimestamp(deal.time).isoformat()
-                            })
-            await asyncio.sleep(5)
+            new_deals = await scan_closed_deals()
         except Exception as e:
             logging.error(f"Помилка моніторингу закриття угод: {e}")
-        await asyncio.sleep(10)
+            new_deals = None
+        if new_deals is None:
+            # Під час збою терміналу не смикаємо його кожні кілька секунд; джитер розводить повтори в часі
+            error_backoff = min(error_backoff * 2, DEAL_ERROR_MAX_BACKOFF)
+            timeout = error_backoff * random.uniform(0.8, 1.2)
+        else:
+            error_backoff = DEAL_POLL_MIN_INTERVAL
+            backoff = DEAL_POLL_MIN_INTERVAL if new_deals else min(backoff * 2, DEAL_POLL_MAX_INTERVAL)
+            timeout = backoff
+        try:
+            await asyncio.wait_for(deal_event.wait(), timeout=timeout)
+            backoff = DEAL_POLL_MIN_INTERVAL  # З'явилась нова позиція — її закриття чекаємо з частим опитуванням
+        except asyncio.TimeoutError:
+            pass
 
-# --- Запуск Telegram-бота у окремому потоці ---
-import threading as _threading
+# --- Push-сповіщення про угоди з терміналу (ZeroMQ) ---
+# Експерт mql5/DealNotifier.mq5 надсилає подію з OnTradeTransaction, і монітор прокидається одразу.
+# Історію угод, як і раніше, дає history_deals_get: повідомлення — лише сигнал «з'явилась угода»,
+# тож опитування з backoff лишається страховкою, якщо експерт не запущений
+DEAL_FEED_MODE = (os.getenv("DEAL_FEED_MODE") or "poll").lower()  # "zmq" — push від експерта, "poll" — лише опитування
+DEAL_ZMQ_ENDPOINT = os.getenv("DEAL_ZMQ_ENDPOINT") or "tcp://127.0.0.1:5555"
 
-def start_telegram_thread():
-    t = _threading.Thread(target=start_telegram_bot, daemon=True)
-    t.start()
+async def deal_push_listener():
+    """Приймає події угод від експерта MT5 через сокет ZeroMQ PULL і будить монітор угод."""
+    if zmq is None:
+        # Помилка конфігурації: виняток зупиняє TaskGroup, щоб режим zmq не працював непомітно без push
+        raise RuntimeError("DEAL_FEED_MODE=zmq, але pyzmq не встановлений")
+    backoff = TASK_RESTART_MIN_BACKOFF
+    while True:
+        socket = zmq.asyncio.Context.instance().socket(zmq.PULL)
+        try:
+            socket.bind(DEAL_ZMQ_ENDPOINT)
+            logging.info(f"Очікую події угод від MT5 на {DEAL_ZMQ_ENDPOINT}")
+            backoff = TASK_RESTART_MIN_BACKOFF
+            while True:
+                message = await socket.recv()
+                logging.info("Подія угоди від MT5: %s", message[:200].decode("utf-8", "replace"))
+                deal_event.set()
+        except zmq.ZMQError as e:
+            logging.error(f"Помилка сокета {DEAL_ZMQ_ENDPOINT} для подій угод: {e}; повтор через {backoff} с")
+        finally:
+            socket.close(linger=0)
+        await asyncio.sleep(backoff * random.uniform(0.8, 1.2))
+        backoff = min(backoff * 2, TASK_RESTART_MAX_BACKOFF)
 
 # --- main ---
+async def main():
+    """Запускає всі фонові задачі бота в одній TaskGroup і чекає на них до зупинки.
+
+    Якщо будь-яка задача падає з винятком, TaskGroup скасовує решту і виняток виходить з asyncio.run,
+    тож бот не залишається напівживим (наприклад, без монітора угод).
+    """
+    # initialize() / shutdown() пулу з'єднань Telegram; без initialize() Bot.shutdown() нічого не закриває
+    async with telegram_bot, asyncio.TaskGroup() as tg:
+        tg.create_task(run_telegram_bot())
+        tg.create_task(journal_writer())
+        tg.create_task(telegram_sender())
+        tg.create_task(signal_dispatcher())
+        for _ in range(NEWS_WORKERS):
+            tg.create_task(news_worker())
+        tg.create_task(polygon_news_ws() if NEWS_FEED_MODE == "ws" else polygon_news_poller())
+        tg.create_task(monitor_closed_trades())
+        if DEAL_FEED_MODE == "zmq":
+            tg.create_task(deal_push_listener())
+        tg.create_task(tradable_symbols_refresher())
+
 if __name__ == "__main__":
-    if not all([OPENAI_API_KEY, OPENAI_ASSISTANT_ID, TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, POLYGON_API_KEY]):
-        logging.critical("Не всі необхідні змінні середовища встановлені. Перевірте ваш .env файл.")
-    elif not initialize_mt5():
+    # uvloop (libuv) швидший за стандартний event loop; на Windows його немає, а якщо не встановлений —
+    # працюємо на стандартному. Політика ставиться до asyncio.run, тож main() одразу виконується на uvloop
+    if sys.platform != "win32":
+        try:
+            import uvloop
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        except ImportError:
+            pass
+    if not initialize_mt5():
         logging.critical("Вихід з програми через помилку підключення до MT5.")
     else:
         try:
-            start_telegram_thread()
-            loop = asyncio.get_event_loop()
-            loop.create_task(polygon_news_poller())
-            loop.create_task(monitor_closed_trades())
-            loop.run_forever()
+            migrate_json_log("trade_results.json", TRADE_LOG_FILE)
+            migrate_json_log("news_log.json", NEWS_LOG_FILE)
+            refresh_tradable_symbols()
+            asyncio.run(main())
         except KeyboardInterrupt:
             logging.info("Бот зупинено вручну.")
+        except ExceptionGroup as eg:
+            logging.critical(f"Фонова задача завершилась з помилкою, бот зупинено: {eg.exceptions!r}")
         finally:
+            flush_journal_queue()
+            close_journal_files()
+            # Дочекатися виклику MT5, що ще виконується в потоці терміналу: mt5.shutdown() не має з ним перетинатися
+            mt5_executor.shutdown(wait=True, cancel_futures=True)
             mt5.shutdown()
             logging.info("З'єднання з MetaTrader 5 закрито.")